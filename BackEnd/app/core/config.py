@@ -1,3 +1,4 @@
+import logging
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -41,6 +42,19 @@ def _env_float(name: str, default: float) -> float:
     except ValueError:
         return default
 
+def _env_log_level(name: str, default: int) -> int:
+    # Acepta nombres ("debug", "WARNING") o números ("10"); si no, el default
+    v = os.getenv(name)
+    if v is None:
+        return default
+    v = v.strip()
+    if not v:
+        return default
+    if v.isdigit():
+        return int(v)
+    level = logging.getLevelName(v.upper())
+    return level if isinstance(level, int) else default
+
 class Settings(BaseModel):
     # App/CORS
     app_host: str = _env_str("APP_HOST","0.0.0.0")
@@ -49,15 +63,33 @@ class Settings(BaseModel):
         s.strip() for s in os.getenv("CORS_ALLOW_ORIGINS","*").split(",")
     ]
 
+    # WebSocket: ventana de agrupado de telemetría (ms)
+    ws_telemetry_batch_ms: int = _env_int("WS_TELEMETRY_BATCH_MS", 50)
+
     # Serial
     serial_enabled: bool  = _env_bool("SERIAL_ENABLED", True)
     serial_port: str      = _env_str("SERIAL_PORT","COM4")
     serial_baud: int      = _env_int("SERIAL_BAUD",115200)
     serial_timeout_s: float = _env_float("SERIAL_TIMEOUT_S",0.5)
+    serial_log_level: int = _env_log_level("SERIAL_LOG_LEVEL", logging.WARNING)
+    serial_low_latency: bool = _env_bool("SERIAL_LOW_LATENCY", True)
 
     # Prefijos y formatos
     serial_telemetry_prefix: str = _env_str("SERIAL_TELEMETRY_PREFIX","RECV_ROVER_")
     serial_image_prefix: str     = _env_str("SERIAL_IMAGE_PREFIX","IMG_ROVER_")
     serial_image_mime: str       = _env_str("SERIAL_IMAGE_MIME","image/jpeg")
 
+    # Derivados de los prefijos (bytes + longitud), calculados una sola vez
+    # para que el hilo serial compare sin decodificar cada línea.
+    telemetry_prefix_bytes: bytes = b""
+    telemetry_prefix_len: int     = 0
+    image_prefix_bytes: bytes     = b""
+    image_prefix_len: int         = 0
+
+    def model_post_init(self, __context) -> None:
+        self.telemetry_prefix_bytes = self.serial_telemetry_prefix.encode("utf-8")
+        self.telemetry_prefix_len = len(self.telemetry_prefix_bytes)
+        self.image_prefix_bytes = self.serial_image_prefix.encode("utf-8")
+        self.image_prefix_len = len(self.image_prefix_bytes)
+
 settings = Settings()
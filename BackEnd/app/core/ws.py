@@ -1,4 +1,6 @@
-from typing import Set
+import asyncio
+from typing import Set, Tuple
+import orjson
 from fastapi import WebSocket
 
 class WSManager:
@@ -7,22 +9,43 @@ class WSManager:
     """
     def __init__(self) -> None:
         self.active: Set[WebSocket] = set()
+        # Copia inmutable de `active` para el broadcast; se rehace solo en
+        # connect/disconnect, no en cada mensaje.
+        self._snapshot: Tuple[WebSocket, ...] = ()
 
     async def connect(self, ws: WebSocket):
         await ws.accept()
         self.active.add(ws)
+        self._snapshot = tuple(self.active)
 
     def disconnect(self, ws: WebSocket):
-        self.active.discard(ws)
+        if ws in self.active:
+            self.active.discard(ws)
+            self._snapshot = tuple(self.active)
 
-    async def broadcast_json(self, data):
+    async def broadcast_json(self, data: dict):
+        """
+        Serializa una sola vez (orjson) y reparte el mismo payload a todos.
+        """
         if not self.active:
             return
-        dead = []
-        for ws in self.active:
-            try:
-                await ws.send_json(data)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect(ws)
+        await self.broadcast_bytes(orjson.dumps(data))
+
+    async def broadcast_bytes(self, buf: bytes):
+        """
+        Reparte un payload JSON ya codificado (bytes) sin volver a serializar.
+        Se manda como frame de texto porque el frontend espera `ev.data` string.
+        """
+        targets = self._snapshot
+        if not targets:
+            return
+        text = buf.decode("utf-8")
+        # Envíos concurrentes: un cliente lento no retrasa a los demás.
+        # `targets` es inmutable: connect/disconnect durante los await no afecta.
+        results = await asyncio.gather(
+            *(ws.send_text(text) for ws in targets), return_exceptions=True
+        )
+        dead = [ws for ws, res in zip(targets, results) if isinstance(res, Exception)]
+        if dead:
+            self.active.difference_update(dead)
+            self._snapshot = tuple(self.active)
@@ -1,6 +1,13 @@
 # app/main.py
+#
+# Ejecutar con uvloop (Linux/macOS, viene con uvicorn[standard]):
+#   uvicorn app.main:app --loop uvloop
+# El loop lo crea uvicorn antes de importar este módulo, así que se elige por
+# CLI (--loop auto ya prefiere uvloop si está instalado); startup() lo loguea.
 import asyncio
-import json
+import logging
+from collections import deque
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -8,7 +15,6 @@ from .core.config import settings
 from .core.ws import WSManager
 from .models import (
     TelemetryRover,
-    ImageFrame,
     SerialSendRequest,
     SerialSendResponse,
 )
@@ -26,9 +32,23 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+# Logging: WARNING por defecto; SERIAL_LOG_LEVEL=DEBUG muestra cada línea serial
+logging.basicConfig(level=logging.WARNING, format="[%(name)s] %(levelname)s %(message)s")
+logging.getLogger("serial").setLevel(settings.serial_log_level)
+
 ws_manager = WSManager()
 serial_worker: SerialWorker | None = None
 
+# Telemetría: se acumula y se manda en lotes cada ws_telemetry_batch_ms
+# (el front no repinta a la tasa del serial). Si se llena, caen las más viejas.
+tm_batch: deque[TelemetryRover] = deque(maxlen=32)
+
+# Imágenes: cola acotada entre el emisor y el broadcast; si un cliente WS va
+# lento se descarta el frame más viejo en vez de acumular envíos pendientes.
+# Se crea en startup(): una asyncio.Queue queda atada al loop que la usa.
+img_queue: asyncio.Queue | None = None
+_drain_tasks: list[asyncio.Task] = []
+
 # Log rápido de configuración al importar el módulo
 print(
     f"[Settings] serial_enabled={settings.serial_enabled} "
@@ -37,13 +57,45 @@ print(
 )
 
 # ---------------- WebSocket ----------------
+# Handlers de comandos entrantes por WS: type -> fn(data, serial_worker)
+def _ws_serial_write(data: dict, worker: SerialWorker):
+    """Monitor serial (vía WS): enviar texto al puerto."""
+    # Acepta tanto "data" como "line" por compatibilidad
+    msg = str(data.get("data") or data.get("line") or "")
+    if msg:
+        worker.send_line(msg, append_nl=True)
+
+
+def _ws_wasd(data: dict, worker: SerialWorker):
+    """Controles WASD."""
+    key = str(data.get("key", "")).lower()
+    duration = data.get("duration_ms", None)
+    if key:
+        worker.send_wasd(key, duration_ms=duration)
+
+
+def _ws_raw(data: dict, worker: SerialWorker):
+    """Envío crudo opcional."""
+    payload = str(data.get("payload", ""))
+    if payload:
+        worker.send_line(payload, append_nl=True)
+
+
+# Agrega aquí otros tipos si los necesitas
+_WS_HANDLERS = {
+    "serial_write": _ws_serial_write,
+    "wasd": _ws_wasd,
+    "raw": _ws_raw,
+}
+
+
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     """
     WebSocket principal:
     - Recibe comandos desde el frontend (serial_write, wasd, raw).
     - La telemetría e imagen NO se reciben aquí: se emiten desde el SerialWorker
-      vía ws_manager.broadcast_json().
+      vía ws_manager.broadcast_bytes().
     """
     await ws_manager.connect(ws)
     try:
@@ -51,44 +103,22 @@ async def ws_endpoint(ws: WebSocket):
             # Recibir comandos entrantes del cliente
             text = await ws.receive_text()
             try:
-                data = json.loads(text)
-            except Exception:
+                data = orjson.loads(text)
+            except orjson.JSONDecodeError:
                 # Ignora mensajes no-JSON
                 continue
+            if not isinstance(data, dict):
+                continue
 
             t = data.get("type")
-
-            # 1) Monitor serial (vía WS): enviar texto al puerto
-            if t == "serial_write":
-                # Acepta tanto "data" como "line" por compatibilidad
-                msg = str(data.get("data") or data.get("line") or "")
-                if serial_worker and msg:
-                    try:
-                        serial_worker.send_line(msg, append_nl=True)
-                    except Exception as e:
-                        print("[WS] Error en serial_write:", e)
-                        # No tiramos la conexión por errores del serial
-
-            # 2) Controles WASD
-            elif t == "wasd":
-                key = str(data.get("key", "")).lower()
-                duration = data.get("duration_ms", None)
-                if serial_worker and key:
-                    try:
-                        serial_worker.send_wasd(key, duration_ms=duration)
-                    except Exception as e:
-                        print("[WS] Error en wasd:", e)
-
-            # 3) Envío crudo opcional
-            elif t == "raw":
-                payload = str(data.get("payload", ""))
-                if serial_worker and payload:
-                    try:
-                        serial_worker.send_line(payload, append_nl=True)
-                    except Exception as e:
-                        print("[WS] Error en raw:", e)
-
-            # Agrega aquí otros tipos si los necesitas
+            handler = _WS_HANDLERS.get(t)
+            if handler is None or not serial_worker:
+                continue
+            try:
+                handler(data, serial_worker)
+            except Exception as e:
+                # No tiramos la conexión por errores del serial
+                print(f"[WS] Error en {t}:", e)
 
     except WebSocketDisconnect:
         ws_manager.disconnect(ws)
@@ -98,35 +128,81 @@ async def ws_endpoint(ws: WebSocket):
 
 
 # --------- Helpers para emitir en WS (desde el hilo serial) ---------
+def _put_latest(q: asyncio.Queue, buf: bytes):
+    """Encola sin bloquear; si la cola está llena, descarta el más viejo."""
+    try:
+        q.put_nowait(buf)
+    except asyncio.QueueFull:
+        q.get_nowait()
+        q.put_nowait(buf)
+
+
+async def _flush_telemetry():
+    """
+    Cada ws_telemetry_batch_ms manda lo acumulado en tm_batch:
+    - 1 muestra:  { type: "telemetry", data: {...} }  (formato de siempre)
+    - N muestras: { type: "telemetry_batch", data: [{...}, ...] }
+    Solo se arranca si ws_telemetry_batch_ms > 0 (ver startup()).
+    """
+    interval = settings.ws_telemetry_batch_ms / 1000.0
+    while True:
+        await asyncio.sleep(interval)
+        if not tm_batch:
+            continue
+        samples = [tm.model_dump() for tm in tm_batch]
+        tm_batch.clear()
+        if len(samples) == 1:
+            payload = {"type": "telemetry", "data": samples[0]}
+        else:
+            payload = {"type": "telemetry_batch", "data": samples}
+        try:
+            await ws_manager.broadcast_bytes(orjson.dumps(payload))
+        except Exception as e:
+            print("[WS] Error en broadcast:", e)
+
+
+async def _drain_to_ws(q: asyncio.Queue):
+    """Consumidor único de una cola: reparte cada payload a los clientes WS."""
+    while True:
+        buf = await q.get()
+        try:
+            await ws_manager.broadcast_bytes(buf)
+        except Exception as e:
+            print("[WS] Error en broadcast:", e)
+
+
 async def emit_ws_telemetry(tm: TelemetryRover):
     """
-    Enviar telemetría a todos los clientes WS.
+    Encola telemetría para el próximo lote (ver _flush_telemetry).
     Formato:
       { type: "telemetry", data: { ...campos de TelemetryRover... } }
-    que es justo lo que está esperando tu hook/useTelemetry en el frontend.
+    o, si hubo varias muestras en la ventana,
+      { type: "telemetry_batch", data: [ {...}, {...} ] }
+    que es lo que esperan useWebSocketFeed/useTelemetry en el frontend.
+    Con WS_TELEMETRY_BATCH_MS <= 0 no se agrupa: cada muestra sale al momento.
     """
-    await ws_manager.broadcast_json(
-        {
-            "type": "telemetry",
-            "data": tm.model_dump(),  # Pydantic v2
-        }
-    )
+    if not ws_manager.active:
+        return
+    if settings.ws_telemetry_batch_ms <= 0:
+        payload = {"type": "telemetry", "data": tm.model_dump()}
+        await ws_manager.broadcast_bytes(orjson.dumps(payload))
+        return
+    tm_batch.append(tm)
 
 
-async def emit_ws_image(img: ImageFrame):
+async def emit_ws_image(envelope: bytes):
     """
     Enviar frame de imagen a todos los clientes WS:
       { type: "image", data: { data_url, timestamp, ... } }
+    El parser ya entrega el mensaje codificado; aquí solo se encola.
     """
-    await ws_manager.broadcast_json(
-        {
-            "type": "image",
-            "data": img.model_dump(),
-        }
-    )
+    q = img_queue
+    if q is None or not ws_manager.active:
+        return
+    _put_latest(q, envelope)
 
 
-async def emit_ws_console(payload: dict):
+async def emit_ws_console(payloads: list[dict]):
     """
     Consola para el front:
     - serial_in:  líneas que llegan del puerto
@@ -135,8 +211,15 @@ async def emit_ws_console(payload: dict):
 
     El SerialWorker ya arma estos payloads con:
       { "type": "serial_in" | "serial_out" | "serial_status", ... }
+    y los entrega agrupados. Uno solo se manda tal cual; varios van como
+      { type: "serial_batch", data: [ {...}, {...} ] }
     """
-    await ws_manager.broadcast_json(payload)
+    if not ws_manager.active:
+        return
+    if len(payloads) == 1:
+        await ws_manager.broadcast_json(payloads[0])
+    else:
+        await ws_manager.broadcast_json({"type": "serial_batch", "data": payloads})
 
 
 # --------- Lógica común para enviar por serial ---------
@@ -176,8 +259,16 @@ async def api_serial_send(req: SerialSendRequest) -> SerialSendResponse:
 # ---------------- Ciclo de vida ----------------
 @app.on_event("startup")
 async def startup():
-    global serial_worker
+    global serial_worker, img_queue
     loop = asyncio.get_running_loop()
+    print(f"[App] Event loop: {type(loop).__module__}.{type(loop).__name__}")
+
+    # Con ventana <= 0 no hay lote: emit_ws_telemetry manda directo y un
+    # sleep(0) en bucle solo quemaría CPU.
+    if settings.ws_telemetry_batch_ms > 0:
+        _drain_tasks.append(asyncio.create_task(_flush_telemetry()))
+    img_queue = asyncio.Queue(maxsize=2)
+    _drain_tasks.append(asyncio.create_task(_drain_to_ws(img_queue)))
 
     if settings.serial_enabled:
         serial_worker = SerialWorker(
@@ -201,10 +292,17 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
-    global serial_worker
+    global serial_worker, img_queue
     if serial_worker:
         serial_worker.stop()
         serial_worker = None
+    for task in _drain_tasks:
+        task.cancel()
+    # Esperamos a que terminen de cancelarse antes de soltar la cola
+    await asyncio.gather(*_drain_tasks, return_exceptions=True)
+    _drain_tasks.clear()
+    tm_batch.clear()
+    img_queue = None  # descarta frames pendientes; startup() crea una nueva
     print("[App] Terminada.")
 
 
@@ -58,6 +58,9 @@ class TelemetryRover(BaseModel):
 class ImageFrame(BaseModel):
     """
     Imagen recibida por serial en Base64.
+    Ya no se instancia en el camino serial -> WS: rover_parser._image_envelope
+    arma el JSON a mano. Este modelo queda como referencia de ese formato;
+    si cambian sus campos hay que actualizar _image_envelope también.
     """
     timestamp: float = Field(..., description="Epoch seconds (float).")
     data_url: str = Field(..., description="data:<mime>;base64,<payload>")
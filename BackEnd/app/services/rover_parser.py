@@ -1,9 +1,9 @@
 # Rover_parser.py
-import base64
 import time
+import orjson
 from typing import Optional, Tuple, List
 from ..core.config import settings
-from ..models import TelemetryRover, ImageFrame
+from ..models import TelemetryRover
 
 # Orden declarado por ti:
 # Rssi, avgRssi, Temp1, Hum1, Temp2, Hum2, V Esp, I Esp, P Esp,
@@ -16,34 +16,48 @@ from ..models import TelemetryRover, ImageFrame
 # - action_bits (3 bits en ASCII, ej. "001")
 # - obstacle_bits (3 bits en ASCII, ej. "100")
 
-def try_parse_telemetry(line: str) -> Optional[TelemetryRover]:
+_NAN = float("nan")
+
+
+def _float_or_nan(x: bytes) -> float:
+    # permite enteros y flotantes (float() acepta bytes ASCII)
+    try:
+        return float(x)
+    except ValueError:
+        return _NAN
+
+
+def try_parse_telemetry(payload: bytes, raw: Optional[str] = None) -> Optional[TelemetryRover]:
     """
-    Si la línea comienza con el prefijo de telemetría, parsea los 24 valores numéricos
-    y, opcionalmente, 2 campos binarios (acción y obstáculos) al final.
+    Parsea el payload de una línea de telemetría (bytes, ya SIN el prefijo y sin
+    espacios: el SerialWorker despacha por prefijo): los 24 valores numéricos y,
+    opcionalmente, 2 campos binarios (acción y obstáculos) al final.
+    `raw` es la línea completa ya decodificada, se guarda tal cual para debug.
     Devuelve TelemetryRover. En error, regresa None.
     """
-    pref = settings.serial_telemetry_prefix
-    if not line.startswith(pref):
-        return None
 
-    payload = line[len(pref):].strip()
-    parts = [p.strip() for p in payload.split(",") if p.strip() != ""]
-
-    # Necesitamos al menos los 24 campos numéricos originales.
-    if len(parts) < 24:
-        return None  # número incorrecto de campos
-
-    # Los primeros 24 SIEMPRE se interpretan como números
-    numeric_parts = parts[:24]
-    # A partir de aquí pueden venir los bits o nada
-    extra_parts = parts[24:]
+    # Camino rápido (trama bien formada): split acotado a 24 números + 2 extras
+    # y float() directo (en C, ya tolera espacios alrededor) con un solo try.
+    # Campos vacíos, no numéricos o comas de más caen al camino tolerante.
+    values = None
+    parts = payload.split(b",", 25)
+    if len(parts) >= 24:
+        # Los primeros 24 SIEMPRE se interpretan como números;
+        # a partir de aquí pueden venir los bits o nada
+        extra_parts = [p.strip() for p in parts[24:]]
+        if all(extra_parts) and b"," not in parts[-1]:
+            try:
+                values = list(map(float, parts[:24]))
+            except ValueError:
+                values = None
 
-    def f(x: str) -> float:
-        # permite enteros y flotantes
-        try:
-            return float(x)
-        except Exception:
-            return float("nan")
+    if values is None:
+        parts = [p.strip() for p in payload.split(b",") if p.strip() != b""]
+        # Necesitamos al menos los 24 campos numéricos originales.
+        if len(parts) < 24:
+            return None  # número incorrecto de campos
+        values = [_float_or_nan(x) for x in parts[:24]]
+        extra_parts = parts[24:]
 
     now = time.time()
 
@@ -57,7 +71,7 @@ def try_parse_telemetry(line: str) -> Optional[TelemetryRover]:
         ax, ay, az,
         gx, gy, gz,
         d1, d2, d3,
-    ) = [f(x) for x in numeric_parts]
+    ) = values
 
     # --- NUEVO: intentar leer bits de acción y obstáculos si vienen ----
     action_bits: Optional[str] = None
@@ -67,58 +81,85 @@ def try_parse_telemetry(line: str) -> Optional[TelemetryRover]:
 
     # Caso esperado: 24 numéricos + 2 campos binarios = 26 partes
     if len(extra_parts) >= 2:
-        action_bits = extra_parts[-2].strip()
-        obstacle_bits = extra_parts[-1].strip()
+        a_bits = extra_parts[-2]
+        o_bits = extra_parts[-1]
+        action_bits = a_bits.decode("ascii", errors="ignore")
+        obstacle_bits = o_bits.decode("ascii", errors="ignore")
 
         # Validación mínima: que sean 3 caracteres y solo 0/1
-        def is_3bit_bin(s: str) -> bool:
-            return len(s) == 3 and all(ch in "01" for ch in s)
-
-        if is_3bit_bin(action_bits):
-            try:
-                action_code = int(action_bits, 2)
-            except ValueError:
-                action_code = None
-        if is_3bit_bin(obstacle_bits):
-            try:
-                obstacle_code = int(obstacle_bits, 2)
-            except ValueError:
-                obstacle_code = None
-
-    return TelemetryRover(
-        timestamp=now,
-        rssi=int(rssi),
-        avg_rssi=int(avg_rssi),
-        temp1=t1, hum1=h1, temp2=t2, hum2=h2,
-        v_esp=vesp, i_esp=iesp, p_esp=pesp,
-        v_m1=vm1, i_m1=im1, p_m1=pm1,
-        v_m2=vm2, i_m2=im2, p_m2=pm2,
-        acc_x=ax, acc_y=ay, acc_z=az,
-        gyro_x=gx, gyro_y=gy, gyro_z=gz,
-        dist1=d1, dist2=d2, dist3=d3,
-        action_bits=action_bits,
-        obstacle_bits=obstacle_bits,
-        action_code=action_code,
-        obstacle_code=obstacle_code,
-        raw=line.strip(),
-    )
-
-
-def try_parse_image(line: str) -> Optional[ImageFrame]:
+        if len(a_bits) == 3 and not a_bits.strip(b"01"):
+            action_code = int(a_bits, 2)
+        if len(o_bits) == 3 and not o_bits.strip(b"01"):
+            obstacle_code = int(o_bits, 2)
+
+    # El modelo lo arma el validador compilado de pydantic-core (Rust) a partir
+    # de un dict: con 29 campos es ~2x más rápido que model_construct(), cuyo
+    # bucle por campo corre en Python.
+    return TelemetryRover.model_validate({
+        "timestamp": now,
+        "rssi": int(rssi),
+        "avg_rssi": int(avg_rssi),
+        "temp1": t1, "hum1": h1, "temp2": t2, "hum2": h2,
+        "v_esp": vesp, "i_esp": iesp, "p_esp": pesp,
+        "v_m1": vm1, "i_m1": im1, "p_m1": pm1,
+        "v_m2": vm2, "i_m2": im2, "p_m2": pm2,
+        "acc_x": ax, "acc_y": ay, "acc_z": az,
+        "gyro_x": gx, "gyro_y": gy, "gyro_z": gz,
+        "dist1": d1, "dist2": d2, "dist3": d3,
+        "action_bits": action_bits,
+        "obstacle_bits": obstacle_bits,
+        "action_code": action_code,
+        "obstacle_code": obstacle_code,
+        "raw": raw,
+    })
+
+
+_B64_ALPHABET = (
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+)
+
+
+def _b64_raw_len(b64: bytes) -> int:
     """
-    Si la línea comienza con el prefijo de imagen, interpreta el resto como Base64
-    y devuelve un ImageFrame con data_url listo para el frontend.
+    Valida Base64 sin decodificarlo (alfabeto estándar, longitud múltiplo de 4 y
+    relleno solo al final; algo más estricto que b64decode(validate=True)).
+    Devuelve el tamaño de los bytes decodificados o -1 si es inválido.
     """
-    pref = settings.serial_image_prefix
-    if not line.startswith(pref):
-        return None
-    b64 = line[len(pref):].strip()
+    n = len(b64)
+    if n % 4 or b64.translate(None, _B64_ALPHABET):
+        return -1
+    # El relleno '=' solo puede ir al final y como máximo 2
+    eq = b64.find(b"=")
+    pad = 0 if eq == -1 else n - eq
+    if pad > 2 or (pad == 2 and b64[-1:] != b"="):
+        return -1
+    return n // 4 * 3 - pad
+
+
+def _image_envelope(ts: float, b64: bytes, raw_len: int) -> bytes:
+    """
+    Mismo JSON que {"type": "image", "data": ImageFrame.model_dump()}, armado en
+    una sola concatenación sobre los bytes Base64 (sin model_dump ni orjson del
+    payload completo).
+    """
+    mime = orjson.dumps(settings.serial_image_mime)[1:-1]  # escapado JSON
+    return b"".join((
+        b'{"type":"image","data":{"timestamp":', repr(ts).encode(),
+        b',"data_url":"data:', mime, b";base64,", b64,
+        b'","raw_len":', str(raw_len).encode(), b"}}",
+    ))
 
-    # Validación mínima de base64:
-    try:
-        raw = base64.b64decode(b64, validate=True)
-    except Exception:
+
+def try_parse_image(b64: bytes) -> Optional[bytes]:
+    """
+    Interpreta el payload de una línea de imagen (bytes, ya SIN el prefijo) como
+    Base64 y devuelve el mensaje WS {type: "image", data: {...}} ya codificado
+    (mismos campos que ImageFrame), listo para reenviar. En error, regresa None.
+    No se arma data_url ni ImageFrame: el Base64 solo se copia una vez, al envelope.
+    """
+    # Validación mínima de base64 sin decodificar (el payload va tal cual al data_url)
+    raw_len = _b64_raw_len(b64)
+    if raw_len < 0:
         return None
 
-    data_url = f"data:{settings.serial_image_mime};base64,{b64}"
-    return ImageFrame(timestamp=time.time(), data_url=data_url, raw_len=len(raw))
+    return _image_envelope(time.time(), b64, raw_len)
@@ -1,19 +1,29 @@
 # app/services/serial_services.py
+import logging
+import os
+import sys
 import threading
 import serial
 import time
 import asyncio
-from typing import Optional, Callable
+from collections import deque
+from typing import Optional, Callable, Iterable
 
 from ..core.config import settings
-from ..models import TelemetryRover, ImageFrame
+from ..models import TelemetryRover
 from .rover_parser import try_parse_telemetry, try_parse_image
 
+# Log del camino caliente (una entrada por línea): DEBUG, apagado por defecto
+log = logging.getLogger("serial")
+
+# Tope del buffer de recepción sin '\n' (una imagen base64 cabe de sobra)
+_RX_MAX = 1 << 20
+
 
 class SerialWorker:
     """
     Hilo lector del puerto serial:
-    - Lee por líneas (terminadas en \n).
+    - Lee en bloques a un buffer interno y lo parte en líneas (terminadas en \n).
     - Intenta parsear telemetría o imagen y llama callbacks asíncronos (emit_ws_*).
     - Expone send_line(text) para escritura por serial (monitor) y send_wasd(key, duration_ms) para controles.
     - Emite a consola WS lo recibido (serial_in) y eco de lo enviado (serial_out) si se provee emit_ws_console.
@@ -23,8 +33,10 @@ class SerialWorker:
         self,
         loop: asyncio.AbstractEventLoop,
         emit_ws_telemetry: Callable[[TelemetryRover], "asyncio.Future"],
-        emit_ws_image: Callable[[ImageFrame], "asyncio.Future"],
-        emit_ws_console: Optional[Callable[[dict], "asyncio.Future"]] = None,
+        # Recibe el mensaje WS de imagen ya codificado (ver try_parse_image)
+        emit_ws_image: Callable[[bytes], "asyncio.Future"],
+        # Recibe una lista de payloads de consola (ver _drain_console)
+        emit_ws_console: Optional[Callable[[list], "asyncio.Future"]] = None,
         # Mapea teclas a cadenas. Ajusta al formato que espera tu firmware.
         wasd_map: Optional[dict] = None,
     ):
@@ -36,7 +48,14 @@ class SerialWorker:
         self._ser: Optional[serial.Serial] = None
         self._thread: Optional[threading.Thread] = None
         self._stop = threading.Event()
-        self._wlock = threading.Lock()
+        self._rx = bytearray()  # bytes recibidos aún sin '\n'
+
+        # Consola WS: buffer circular (deque es thread-safe para append/popleft)
+        # que una sola tarea del event loop vacía en lote. _kick queda en True
+        # mientras esa tarea vive: como mucho un broadcast de consola en vuelo.
+        self._console_q: deque = deque(maxlen=2048)
+        self._kick = False
+        self._console_task: Optional[asyncio.Task] = None
 
         # Mapeo por defecto: "CMD:<key>"
         self.wasd_map = wasd_map or {
@@ -46,6 +65,11 @@ class SerialWorker:
             "d": "CMD:d",
             " ": "CMD:stop",
         }
+        # Comandos sin duración ya codificados (con '\n'): se mandan tal cual
+        self._wasd_bytes = {
+            k: (v if v.endswith("\n") else f"{v}\n").encode("utf-8", errors="ignore")
+            for k, v in self.wasd_map.items()
+        }
 
     # ---------- Ciclo de vida ----------
     def start(self):
@@ -71,6 +95,16 @@ class SerialWorker:
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=1.0)
         self._close_port()
+        # Corta el vaciado de consola pendiente (la tarea vive en el loop)
+        task = self._console_task
+        if task is not None and not task.done():
+            try:
+                self.loop.call_soon_threadsafe(task.cancel)
+            except Exception:
+                pass  # loop ya cerrado
+        self._console_task = None
+        self._console_q.clear()
+        self._kick = False
         print("[Serial] Cerrado.")
 
     # ---------- API pública de envío ----------
@@ -81,19 +115,48 @@ class SerialWorker:
         """
         if not text:
             return 0
-        payload = f"{text}\n" if append_nl and not text.endswith("\n") else text
-        n = self._write_bytes(payload.encode("utf-8", errors="ignore"))
+        data = text.encode("utf-8", errors="ignore")
+        if append_nl and not data.endswith(b"\n"):
+            data += b"\n"
+        n = self._write_bytes(data)
 
         # Eco a consola de WS (opcional)
         self._emit_console_safe(
             {
                 "type": "serial_out",
-                "line": payload.rstrip("\r\n"),
+                "line": text.rstrip("\r\n"),
                 "ts": time.time(),
             }
         )
         return n
 
+    def send_lines(self, lines: Iterable[str]) -> int:
+        """
+        Escribe varias líneas en un solo write() (ráfagas de comandos).
+        Cada una termina en '\n'. Devuelve bytes escritos.
+        """
+        out = bytearray()
+        sent = []
+        for text in lines:
+            if not text:
+                continue
+            b = text.encode("utf-8", errors="ignore")
+            if not b:
+                continue
+            # El '\n' se mira por línea, no sobre el buffer acumulado
+            if not b.endswith(b"\n"):
+                b += b"\n"
+            out += b
+            sent.append(text.rstrip("\r\n"))
+        if not out:
+            return 0
+        n = self._write_bytes(out)
+
+        ts = time.time()
+        for line in sent:
+            self._emit_console_safe({"type": "serial_out", "line": line, "ts": ts})
+        return n
+
     def send_wasd(self, key: str, duration_ms: Optional[int] = None):
         """
         Envía un comando WASD mapeado. Ajusta a tu firmware:
@@ -107,10 +170,22 @@ class SerialWorker:
         if not cmd:
             return
 
-        if duration_ms is not None:
-            line = f"{cmd},{int(duration_ms)}"
-        else:
+        if duration_ms is None:
+            data = self._wasd_bytes.get(k)
+            if data is not None:
+                # Camino rápido: sin formateo ni encode por tecla
+                self._write_bytes(data)
+                self._emit_console_safe(
+                    {
+                        "type": "serial_out",
+                        "line": cmd.rstrip("\r\n"),
+                        "ts": time.time(),
+                    }
+                )
+                return
             line = cmd
+        else:
+            line = f"{cmd},{int(duration_ms)}"
 
         self.send_line(line, append_nl=True)
 
@@ -130,65 +205,24 @@ class SerialWorker:
                     self._try_reopen_with_backoff()
                     continue
 
-                # Lee hasta '\n' o hasta timeout
-                data = self._ser.readline()
-                if not data:
+                # Lectura en bloque: todo lo que haya en el buffer del driver
+                # (o espera 1 byte hasta timeout) y partimos por '\n' aquí,
+                # en lugar de readline() que lee byte a byte.
+                chunk = self._ser.read(max(1, self._ser.in_waiting))
+                if not chunk:
                     # Timeout sin datos -> simplemente intenta otra vez
                     continue
+                rx = self._rx
+                rx += chunk
 
-                line = data.decode("utf-8", errors="ignore").strip()
-                if not line:
-                    continue
-                print("[Serial] Línea recibida cruda:", repr(line))
+                while (nl := rx.find(b"\n")) != -1:
+                    data = bytes(rx[:nl])
+                    del rx[:nl + 1]
+                    self._handle_line(data)
 
-                # Siempre mandamos primero la línea cruda al monitor WS
-                self._emit_console_safe(
-                    {
-                        "type": "serial_in",
-                        "line": line,
-                        "ts": time.time(),
-                    }
-                )
-
-                 # 1) Telemetría (con try/except local para no tirar el loop)
-                try:
-                    tm = try_parse_telemetry(line)
-                except Exception as e:
-                    print(f"[Serial] Error parseando telemetría: {e}")
-                    tm = None
-
-                if tm is not None:
-                    print("[Serial] Telemetría parseada OK:", tm.dict())
-                    asyncio.run_coroutine_threadsafe(
-                        self.emit_ws_telemetry(tm), self.loop
-                    )
-                    continue
-
-
-                # 2) Imagen (también protegido)
-                try:
-                    img = try_parse_image(line)
-                except Exception as e:
-                    print(f"[Serial] Error parseando imagen: {e}")
-                    img = None
-
-                if img is not None:
-                    asyncio.run_coroutine_threadsafe(
-                        self.emit_ws_image(img), self.loop
-                    )
-                    # opcional: en consola mostramos marcador genérico
-                    self._emit_console_safe(
-                        {
-                            "type": "serial_in",
-                            "line": "<image_frame_base64>",
-                            "ts": time.time(),
-                        }
-                    )
-                    continue
-
-                # 3) Si no es telemetría ni imagen, ya fue enviada como serial_in arriba,
-                #    no hacemos nada más.
-                #    (Si quieres filtrar logs ruidosos, puedes meter lógica aquí.)
+                if len(rx) > _RX_MAX:
+                    # Basura sin '\n' (baudrate equivocado, etc.): descartamos
+                    rx.clear()
 
             except serial.SerialException as e:
                 # Error de puerto (desconexión, permiso, etc.) -> cerrar y reintentar
@@ -208,6 +242,70 @@ class SerialWorker:
                 print(f"[Serial] Error en loop serial (no desconecta): {e}")
                 time.sleep(0.1)
 
+    def _handle_line(self, data: bytes):
+        # Trabajamos en bytes: el prefijo se compara sin decodificar
+        data = data.strip()
+        if not data:
+            return
+        line = data.decode("utf-8", errors="ignore")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Línea recibida cruda: %r", line)
+
+        # Siempre mandamos primero la línea cruda al monitor WS
+        self._emit_console_safe(
+            {
+                "type": "serial_in",
+                "line": line,
+                "ts": time.time(),
+            }
+        )
+
+        # Despacho por prefijo aquí, una sola vez: cada parser recibe ya el
+        # payload sin prefijo y solo se llama al que corresponde.
+        # 1) Telemetría (con try/except local para no tirar el loop)
+        if data.startswith(settings.telemetry_prefix_bytes):
+            try:
+                tm = try_parse_telemetry(
+                    data[settings.telemetry_prefix_len:].lstrip(), raw=line
+                )
+            except Exception as e:
+                log.warning("Error parseando telemetría: %s", e)
+                tm = None
+
+            if tm is not None:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Telemetría parseada OK: %r", tm)
+                asyncio.run_coroutine_threadsafe(
+                    self.emit_ws_telemetry(tm), self.loop
+                )
+                return
+
+        # 2) Imagen (también protegido)
+        if not data.startswith(settings.image_prefix_bytes):
+            # 3) Si no es telemetría ni imagen, ya fue enviada como serial_in arriba,
+            #    no hacemos nada más.
+            #    (Si quieres filtrar logs ruidosos, puedes meter lógica aquí.)
+            return
+
+        try:
+            envelope = try_parse_image(data[settings.image_prefix_len:].lstrip())
+        except Exception as e:
+            log.warning("Error parseando imagen: %s", e)
+            envelope = None
+
+        if envelope is not None:
+            asyncio.run_coroutine_threadsafe(
+                self.emit_ws_image(envelope), self.loop
+            )
+            # opcional: en consola mostramos marcador genérico
+            self._emit_console_safe(
+                {
+                    "type": "serial_in",
+                    "line": "<image_frame_base64>",
+                    "ts": time.time(),
+                }
+            )
+
     def _open_port(self):
         try:
             self._ser = serial.Serial(
@@ -222,6 +320,9 @@ class SerialWorker:
             except Exception:
                 pass
 
+            if settings.serial_low_latency:
+                self._set_low_latency()
+
             self._emit_console_safe(
                 {
                     "type": "serial_status",
@@ -235,7 +336,32 @@ class SerialWorker:
             self._ser = None
             print(f"[Serial] No se pudo abrir {settings.serial_port}: {e}")
 
+    def _set_low_latency(self):
+        """
+        Linux: los adaptadores USB-serial (FTDI, CP210x, CH340) acumulan hasta
+        ~16 ms antes de entregar paquetes chicos. Activamos ASYNC_LOW_LATENCY
+        (TIOCSSERIAL vía pyserial) y, si el driver no lo soporta, bajamos el
+        latency_timer de sysfs a 1 ms. En otros sistemas no hace nada.
+        """
+        if not sys.platform.startswith("linux") or not self._ser:
+            return
+        try:
+            self._ser.set_low_latency_mode(True)
+            return
+        except Exception as e:
+            print(f"[Serial] ASYNC_LOW_LATENCY no disponible: {e}")
+
+        tty = os.path.basename(os.path.realpath(settings.serial_port))
+        path = f"/sys/bus/usb-serial/devices/{tty}/latency_timer"
+        try:
+            with open(path, "w") as fh:
+                fh.write("1")
+        except OSError:
+            # Sin permisos o no es un adaptador usb-serial: se deja como está
+            pass
+
     def _close_port(self):
+        self._rx.clear()
         try:
             if self._ser and self._ser.is_open:
                 self._ser.close()
@@ -253,16 +379,47 @@ class SerialWorker:
     def _write_bytes(self, data: bytes) -> int:
         if not self._ser or not self._ser.is_open:
             raise RuntimeError("Puerto serial no abierto.")
-        with self._wlock:
-            return self._ser.write(data)
+        # Sin lock: todas las escrituras salen del hilo del event loop
+        # (handlers WS y /api/serial/send); el hilo lector solo lee.
+        return self._ser.write(data)
 
     def _emit_console_safe(self, payload: dict):
         if not self.emit_ws_console:
             return
+        self._console_q.append(payload)
+        if self._kick:
+            # Ya hay un drenado pendiente en el loop; se lo llevará también
+            return
+        self._kick = True
         try:
-            asyncio.run_coroutine_threadsafe(
-                self.emit_ws_console(payload), self.loop
-            )
+            self.loop.call_soon_threadsafe(self._start_console_drain)
         except Exception:
-            # No queremos que un error de WS rompa el hilo serial
-            pass
+            # No queremos que un error de WS (p.ej. loop cerrado) rompa el hilo serial
+            self._kick = False
+
+    def _start_console_drain(self):
+        # Corre en el event loop. Si ya hay un drenador vivo, él se lleva lo nuevo.
+        task = self._console_task
+        if task is not None and not task.done():
+            return
+        # Guardamos la referencia para que la tarea no la recoja el GC
+        self._console_task = self.loop.create_task(self._drain_console())
+
+    async def _drain_console(self):
+        """
+        Vacía el buffer de consola en lotes, esperando cada broadcast antes del
+        siguiente. _kick se baja recién con el buffer vacío; si entró algo justo
+        en ese momento, se retoma en lugar de dejarlo esperando.
+        """
+        q = self._console_q
+        while True:
+            while q:
+                batch = [q.popleft() for _ in range(len(q))]
+                try:
+                    await self.emit_ws_console(batch)
+                except Exception:
+                    pass
+            self._kick = False
+            if not q:
+                return
+            self._kick = True
@@ -159,6 +159,31 @@ export function useTelemetry(options?: UseTelemetryOptions): UseTelemetryState {
           const obj = JSON.parse(text);
           if (!isPlainObject(obj)) return;
 
+          // 0) Lote de telemetría: { type: "telemetry_batch", data: [ {...}, ... ] }
+          if ((obj as any).type === "telemetry_batch") {
+            const items = (obj as any).data;
+            if (!Array.isArray(items)) return;
+            const batch: TelemetryRecord[] = [];
+            for (const item of items) {
+              if (!isPlainObject(item)) continue;
+              seqRef.current += 1;
+              batch.push({
+                ts: extractTs(obj, item) || nowIso,
+                data: item,
+                seq: seqRef.current,
+              });
+            }
+            if (batch.length === 0) return;
+
+            setRecords((prev) => {
+              // Más reciente primero, igual que el caso de una sola muestra
+              const next = [...batch.reverse(), ...prev];
+              if (next.length > maxBuffer) next.length = maxBuffer;
+              return next;
+            });
+            return;
+          }
+
           let payload: Record<string, any> | null = null;
 
           // 1) Mensajes con type que incluya "telemetry"
@@ -40,9 +40,7 @@ export function useWebSocketFeed(
 
   const handleMessage = useCallback(
     (event: MessageEvent<string>) => {
-      try {
-        const msg = JSON.parse(event.data);
-
+      const dispatch = (msg: any) => {
         if (!msg || typeof msg.type !== "string") return;
 
         // --- Telemetría normal ---
@@ -60,6 +58,21 @@ export function useWebSocketFeed(
           return;
         }
 
+        // --- Lote de telemetría (el backend agrupa varias muestras por mensaje) ---
+        if (msg.type === "telemetry_batch") {
+          if (!Array.isArray(msg.data) || msg.data.length === 0) return;
+          const batch = msg.data as TelemetryRow[];
+
+          setRows((prev) => {
+            const next = [...prev, ...batch];
+            if (next.length > maxRows) {
+              next.splice(0, next.length - maxRows);
+            }
+            return next;
+          });
+          return;
+        }
+
         // --- Consola serial ---
         if (msg.type === "serial_in") {
           const ts =
@@ -128,6 +141,18 @@ export function useWebSocketFeed(
             setLastImageDataUrl(`data:${mime};base64,${msg.b64}`);
           }
         }
+      };
+
+      try {
+        const msg = JSON.parse(event.data);
+
+        // --- Lote de consola: el backend agrupa varias líneas en un mensaje ---
+        if (msg && msg.type === "serial_batch" && Array.isArray(msg.data)) {
+          for (const item of msg.data) dispatch(item);
+          return;
+        }
+
+        dispatch(msg);
       } catch (err) {
         console.error("WS message parse error", err);
       }